@@ -1,12 +1,14 @@
 from __future__ import annotations
 
+import functools
 import logging
 import os
 import re
 from pathlib import Path
+from types import ModuleType
 from typing import Iterable, Optional
 
-import matplotlib.pyplot as plt
+import numpy as np
 import pandas as pd
 
 
@@ -16,6 +18,7 @@ logger = logging.getLogger(__name__)
 REPO_ROOT = Path(__file__).resolve().parents[1]
 DATA_DIR = REPO_ROOT / "data"
 OUTPUTS_DIR = REPO_ROOT / "outputs"
+EXCEL_ENGINE = "calamine"
 
 FORCED_SCALE_LABELS = {
     "most": (1, 3),
@@ -28,6 +31,8 @@ LIKERT_LABELS = {
     "least": (1, 2),
 }
 
+BUCKET_LABELS = ("most", "neutral", "least")
+
 TEXT_BUCKET_MAP = {
     "most beneficial": "most",
     "most": "most",
@@ -38,6 +43,18 @@ TEXT_BUCKET_MAP = {
     "least": "least",
 }
 
+# "least" is matched first so "least beneficial" is not caught by "beneficial"
+TEXT_BUCKET_PATTERNS = {
+    bucket: re.compile(
+        "|".join(re.escape(key) for key, value in TEXT_BUCKET_MAP.items() if value == bucket)
+    )
+    for bucket in ("least", "most", "neutral")
+}
+TEXT_SKIP_PATTERN = re.compile(r"did not take|^n/a$|^$")
+
+NON_ALNUM_PATTERN = re.compile(r"[^a-z0-9]+")
+UNDERSCORE_RUN_PATTERN = re.compile(r"_+")
+
 BLOCK_COLUMN_HINTS = (
     "rank",
     "beneficial",
@@ -49,11 +66,12 @@ BLOCK_COLUMN_HINTS = (
 )
 
 
+@functools.lru_cache(maxsize=4096)
 def snake_case(value: str) -> str:
     value = str(value)
     value = value.strip().lower()
-    value = re.sub(r"[^a-z0-9]+", "_", value)
-    value = re.sub(r"_+", "_", value).strip("_")
+    value = NON_ALNUM_PATTERN.sub("_", value)
+    value = UNDERSCORE_RUN_PATTERN.sub("_", value).strip("_")
     return value or "unnamed"
 
 
@@ -82,34 +100,48 @@ def pick_data_file(data_dir: Path) -> Path:
     return files[0]
 
 
-def categorize_numeric(value: float, scale_max: int) -> Optional[str]:
-    if pd.isna(value):
-        return None
+def numeric_bins(scale_max: int) -> Optional[tuple[list[float], list[str]]]:
     if scale_max >= 8:
-        bins = FORCED_SCALE_LABELS
+        ranges = FORCED_SCALE_LABELS
     elif scale_max == 5:
-        bins = LIKERT_LABELS
+        ranges = LIKERT_LABELS
     else:
         return None
 
-    for label, (low, high) in bins.items():
-        if low <= value <= high:
-            return label
-    return None
+    # integer ranges become half-open bin edges, e.g. (1, 3) -> (0.5, 3.5]
+    ordered = sorted(ranges.items(), key=lambda item: item[1][0])
+    edges = [ordered[0][1][0] - 0.5] + [high + 0.5 for _, (_, high) in ordered]
+    labels = [label for label, _ in ordered]
+    return edges, labels
 
 
-def categorize_text(value: object) -> Optional[str]:
-    if pd.isna(value):
-        return None
-    text = str(value).strip().lower()
-    if not text:
-        return None
-    if "did not take" in text or "n/a" == text:
-        return None
-    for key, bucket in TEXT_BUCKET_MAP.items():
-        if key in text:
-            return bucket
-    return None
+def bucket_numeric(series: pd.Series, scale_max: int) -> pd.Series:
+    bins = numeric_bins(scale_max)
+    if bins is None:
+        return pd.Series(None, index=series.index, dtype=object)
+    edges, labels = bins
+    return pd.cut(series, bins=edges, labels=labels).astype(object)
+
+
+def categorize_text(series: pd.Series) -> pd.Series:
+    text = series.astype("string").str.strip().str.lower()
+    buckets = np.full(len(text), None, dtype=object)
+
+    # most answers are exactly one of the map keys, so a hash lookup covers them
+    exact = text.isin(list(TEXT_BUCKET_MAP)).to_numpy(dtype=bool)
+    buckets[exact] = text[exact].map(TEXT_BUCKET_MAP).to_numpy(dtype=object)
+
+    # substring patterns only run on the remaining free-form answers
+    rest = text[~exact]
+    skip = rest.str.contains(TEXT_SKIP_PATTERN, na=True).to_numpy(dtype=bool)
+    conditions = [
+        rest.str.contains(pattern, na=False).to_numpy(dtype=bool)
+        for pattern in TEXT_BUCKET_PATTERNS.values()
+    ]
+    matched = np.select(conditions, list(TEXT_BUCKET_PATTERNS), default=None)
+    matched[skip] = None
+    buckets[~exact] = matched
+    return pd.Series(buckets, index=series.index, dtype=object)
 
 
 def looks_like_course_col(name: str) -> bool:
@@ -117,8 +149,22 @@ def looks_like_course_col(name: str) -> bool:
     return any(hint in lowered for hint in BLOCK_COLUMN_HINTS)
 
 
+def rank_scale_max(series: pd.Series) -> Optional[int]:
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    values = values[~np.isnan(values)]
+    if values.size == 0:
+        return None
+    # rank/rating data should have many small integers; np.unique only runs
+    # on columns that pass the cheap range check
+    in_range = np.count_nonzero((values >= 1) & (values <= 8))
+    if in_range / values.size < 0.7 or np.unique(values).size < 3:
+        return None
+    return int(values.max())
+
+
 def standardize_df(df: pd.DataFrame) -> pd.DataFrame:
-    renamed = {}
+    # renames in place; callers pass freshly read sheets they own
+    names = []
     used = set()
     for c in df.columns:
         base = snake_case(c)
@@ -128,42 +174,57 @@ def standardize_df(df: pd.DataFrame) -> pd.DataFrame:
             name = f"{base}_{i}"
             i += 1
         used.add(name)
-        renamed[c] = name
-    return df.rename(columns=renamed)
+        names.append(name)
+    df.columns = names
+    return df
 
 
 def find_rank_records(df: pd.DataFrame) -> pd.DataFrame:
-    records = []
-
-    # Case 1: wide forced-rank/rating columns where each course is its own column
-    numeric_candidates = []
-    for col in df.columns:
-        series = pd.to_numeric(df[col], errors="coerce")
-        non_na = series.dropna()
-        if non_na.empty:
-            continue
-        # rank/rating data should have many small integers
-        if non_na.between(1, 8).mean() >= 0.7 and non_na.nunique() >= 3:
-            numeric_candidates.append((col, series, int(non_na.max())))
-
-    filtered_candidates = [
-        (col, series, mx)
-        for col, series, mx in numeric_candidates
-        if looks_like_course_col(col)
-    ]
-    if filtered_candidates:
-        numeric_candidates = filtered_candidates
+    # coerce lazily and at most once per column; Case 2 reuses these
+    numeric_cols = set(df.select_dtypes(include="number").columns)
+    numeric_series: dict[str, pd.Series] = {}
+
+    def as_numeric(col: str) -> pd.Series:
+        if col not in numeric_series:
+            series = df[col]
+            if col not in numeric_cols:
+                series = pd.to_numeric(series, errors="coerce")
+            numeric_series[col] = series
+        return numeric_series[col]
+
+    def scan_numeric(cols: Iterable[str]) -> list[tuple[str, pd.Series, int]]:
+        candidates = []
+        for col in cols:
+            series = as_numeric(col)
+            scale_max = rank_scale_max(series)
+            if scale_max is not None:
+                candidates.append((col, series, scale_max))
+        return candidates
+
+    # Case 1: wide forced-rank/rating columns where each course is its own column.
+    # Course-like columns win when any qualify, so the rest are only a fallback.
+    course_like = [c for c in df.columns if looks_like_course_col(c)]
+    numeric_candidates = scan_numeric(course_like)
+    if not numeric_candidates:
+        numeric_candidates = scan_numeric(c for c in df.columns if c not in course_like)
 
     if numeric_candidates:
         logger.info("Detected %s numeric ranking columns.", len(numeric_candidates))
+        course_arrays = []
+        bucket_arrays = []
         for col, series, scale_max in numeric_candidates:
-            for value in series:
-                bucket = categorize_numeric(value, scale_max)
-                if bucket is None:
-                    continue
-                records.append({"course": col, "bucket": bucket})
-        if records:
-            return pd.DataFrame(records)
+            buckets = bucket_numeric(series, scale_max).dropna()
+            if buckets.empty:
+                continue
+            course_arrays.append(np.full(len(buckets), col, dtype=object))
+            bucket_arrays.append(buckets.to_numpy())
+        if bucket_arrays:
+            return pd.DataFrame(
+                {
+                    "course": np.concatenate(course_arrays),
+                    "bucket": np.concatenate(bucket_arrays),
+                }
+            )
 
     # Case 2: long form with a course column and rank/value column
     course_cols = [c for c in df.columns if "course" in c or "program" in c]
@@ -171,7 +232,7 @@ def find_rank_records(df: pd.DataFrame) -> pd.DataFrame:
     for ccol in course_cols:
         course_series = df[ccol].astype("string")
         for rcol in rank_cols:
-            rank_series = pd.to_numeric(df[rcol], errors="coerce")
+            rank_series = as_numeric(rcol)
             valid = rank_series.dropna()
             if valid.empty:
                 continue
@@ -183,7 +244,7 @@ def find_rank_records(df: pd.DataFrame) -> pd.DataFrame:
             tmp = tmp.dropna(subset=["course", "value"])
             tmp["course"] = tmp["course"].str.strip()
             tmp = tmp[tmp["course"] != ""]
-            tmp["bucket"] = tmp["value"].apply(lambda v: categorize_numeric(v, scale_max))
+            tmp["bucket"] = bucket_numeric(tmp["value"], scale_max)
             tmp = tmp.dropna(subset=["bucket"])
             if not tmp.empty:
                 return tmp[["course", "bucket"]]
@@ -195,13 +256,13 @@ def find_rank_records(df: pd.DataFrame) -> pd.DataFrame:
         if any(k in c for k in ("beneficial", "preference", "rank", "rating", "course"))
     ]
     for col in text_bucket_cols:
-        mapped = df[col].map(categorize_text)
+        mapped = categorize_text(df[col])
         if mapped.notna().sum() < 5:
             continue
         if "course" in df.columns:
             tmp = pd.DataFrame({"course": df["course"], "bucket": mapped})
             tmp = tmp.dropna(subset=["course", "bucket"])
-            tmp["course"] = tmp["course"].astype(str).str.strip()
+            tmp["course"] = tmp["course"].astype("string").str.strip()
             tmp = tmp[tmp["course"] != ""]
             if not tmp.empty:
                 logger.info("Detected bucketed text with explicit course column.")
@@ -215,23 +276,36 @@ def find_rank_records(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def summarize_nas(rank_records: pd.DataFrame) -> pd.DataFrame:
-    grouped = rank_records.groupby("course", dropna=True)
-    summary = grouped["bucket"].value_counts().unstack(fill_value=0)
-    for col in ("most", "neutral", "least"):
-        if col not in summary.columns:
-            summary[col] = 0
-    summary = summary[["most", "neutral", "least"]]
-    summary = summary.rename(
-        columns={"most": "n_most", "neutral": "n_neutral", "least": "n_least"}
+    # tally (course, bucket) pairs with one bincount over the combined codes;
+    # the sort below orders the result
+    course_codes, courses = pd.factorize(rank_records["course"], sort=False)
+    bucket_codes = pd.Categorical(
+        rank_records["bucket"], categories=list(BUCKET_LABELS)
+    ).codes
+    valid = (course_codes >= 0) & (bucket_codes >= 0)
+    n_buckets = len(BUCKET_LABELS)
+    flat = course_codes[valid] * n_buckets + bucket_codes[valid]
+    counts = np.bincount(flat, minlength=len(courses) * n_buckets)
+    counts = counts.reshape(len(courses), n_buckets).astype(np.int64)
+    n_total = counts.sum(axis=1)
+    keep = n_total > 0
+    counts, n_total = counts[keep], n_total[keep]
+    summary = pd.DataFrame(
+        counts,
+        index=pd.Index(courses[keep], name="course"),
+        columns=[f"n_{label}" for label in BUCKET_LABELS],
+    )
+    pct_most = counts[:, 0] / n_total * 100
+    pct_least = counts[:, 2] / n_total * 100
+    summary = summary.assign(
+        n_total=n_total,
+        pct_most=pct_most,
+        pct_least=pct_least,
+        nas=pct_most - pct_least,
     )
-    summary["n_total"] = summary[["n_most", "n_neutral", "n_least"]].sum(axis=1)
-    summary = summary[summary["n_total"] > 0]
-    summary["pct_most"] = summary["n_most"] / summary["n_total"] * 100
-    summary["pct_least"] = summary["n_least"] / summary["n_total"] * 100
-    summary["nas"] = summary["pct_most"] - summary["pct_least"]
 
     summary = summary.sort_values(
-        by=["nas", "pct_most", "n_total"], ascending=[False, False, False]
+        by=["nas", "pct_most", "n_total", "course"], ascending=[False, False, False, True]
     )
     summary = summary.reset_index()
     summary.insert(0, "rank", range(1, len(summary) + 1))
@@ -250,7 +324,20 @@ def summarize_nas(rank_records: pd.DataFrame) -> pd.DataFrame:
     ]
 
 
+@functools.lru_cache(maxsize=None)
+def load_pyplot() -> ModuleType:
+    # deferred so CSV-only runs skip the pyplot import; the headless backend is
+    # selected once, before pyplot loads
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
 def plot_rank_order(summary: pd.DataFrame, output_path: Path, year: Optional[str]) -> None:
+    plt = load_pyplot()
     ordered = summary.sort_values("nas", ascending=True)
 
     plt.figure(figsize=(10, max(4, len(ordered) * 0.45)))
@@ -267,16 +354,29 @@ def plot_rank_order(summary: pd.DataFrame, output_path: Path, year: Optional[str
 
 
 def load_all_sheets(path: Path) -> pd.DataFrame:
-    xls = pd.ExcelFile(path)
-    frames = []
-    for sheet in xls.sheet_names:
-        df = pd.read_excel(path, sheet_name=sheet)
-        if df.empty:
-            continue
-        df = standardize_df(df)
-        frames.append(df)
+    # one pass over the workbook container; sheets come back in workbook order
+    with pd.ExcelFile(path, engine=EXCEL_ENGINE) as xls:
+        sheets = pd.read_excel(xls, sheet_name=None)
+    frames = [standardize_df(df) for df in sheets.values() if not df.empty]
     if not frames:
         raise ValueError(f"No non-empty sheets found in workbook: {path}")
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+
+    # sheets that standardize to the same schema are stacked column by column,
+    # skipping concat's column alignment
+    first = frames[0]
+    same_schema = all(
+        frame.columns.equals(first.columns) and frame.dtypes.equals(first.dtypes)
+        for frame in frames[1:]
+    )
+    if same_schema and all(isinstance(dtype, np.dtype) for dtype in first.dtypes):
+        return pd.DataFrame(
+            {
+                col: np.concatenate([frame[col].to_numpy() for frame in frames])
+                for col in first.columns
+            }
+        )
     return pd.concat(frames, ignore_index=True, sort=False)
 
 